@@ -1,2 +1,4 @@
+from .render_client import RenderClient, RenderConfig
+from .types import CameraState
 from .version import __version__
-from .viewer import VIEWER_LOCK, CameraState, Viewer, with_viewer_lock
+from .viewer import Viewer
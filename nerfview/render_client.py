@@ -1,22 +1,136 @@
 
 from dataclasses import dataclass
+import inspect
+import struct
 import threading
 import time
+import traceback
 from typing import Callable, Literal, Optional, Tuple
 
 import numpy as np
 
 import viser
-import viser.transforms as vt
 
 from nerfview.types import CameraState
 
+# Snapshot of one client's camera: (wxyz, position, optional precomputed
+# rotation matrix). Taken once per render so the skip key and the rendered
+# pose cannot diverge if the camera moves mid-render.
+CameraPose = Tuple[np.ndarray, np.ndarray, Optional[np.ndarray]]
+
+# The pre-encoded background path queues viser's message directly, so it
+# leans on two viser internals; disable it (falling back to the public
+# set_background_image) if they move in a future viser release.
+try:
+    from viser import _messages
+    from viser._scene_api import cv2_imencode_with_fallback
+except ImportError:
+    _messages = None
+    cv2_imencode_with_fallback = None
+
+# Optional fast JPEG path: libjpeg-turbo via PyTurboJPEG is 2-6x faster than
+# the Pillow/OpenCV encode viser does internally. We pre-encode the bytes
+# ourselves and hand them straight to viser's background-image message.
+try:
+    from turbojpeg import TJPF_RGB, TJSAMP_420, TJSAMP_422, TJSAMP_444, TurboJPEG
+
+    _turbo_jpeg: Optional["TurboJPEG"] = TurboJPEG() if _messages is not None else None
+    _subsampling = {"420": TJSAMP_420, "422": TJSAMP_422, "444": TJSAMP_444}
+except (ImportError, OSError, RuntimeError):
+    _turbo_jpeg = None
+
+# Optional fast PNG path for depth: imagecodecs wraps SIMD zlib-ng deflate.
+try:
+    import imagecodecs
+except ImportError:
+    imagecodecs = None
+
+# Optional compiled pose kernel: skips Python bytecode dispatch for the
+# per-event quaternion expansion when numba is installed.
+try:
+    import numba
+except ImportError:
+    numba = None
+
+if numba is not None:
+    @numba.njit(cache=True, fastmath=True)
+    def _quat_to_pose(w, x, y, z, px, py, pz, out):
+        xx, yy, zz = x * x, y * y, z * z
+        xy, xz, yz = x * y, x * z, y * z
+        wx, wy, wz = w * x, w * y, w * z
+
+        out[0, 0] = 1 - 2 * (yy + zz)
+        out[0, 1] = 2 * (xy - wz)
+        out[0, 2] = 2 * (xz + wy)
+        out[0, 3] = px
+        out[1, 0] = 2 * (xy + wz)
+        out[1, 1] = 1 - 2 * (xx + zz)
+        out[1, 2] = 2 * (yz - wx)
+        out[1, 3] = py
+        out[2, 0] = 2 * (xz - wy)
+        out[2, 1] = 2 * (yz + wx)
+        out[2, 2] = 1 - 2 * (xx + yy)
+        out[2, 3] = pz
+else:
+    _quat_to_pose = None
+
+
+def batch_quat_to_mat(wxyz: np.ndarray) -> np.ndarray:
+    """Convert (N, 4) wxyz unit quaternions to (N, 3, 3) rotation matrices.
+
+    Same expansion as RenderClient.get_camera_state, amortized over all
+    clients in one vectorized pass.
+    """
+    w, x, y, z = wxyz.T
+    xx, yy, zz = x * x, y * y, z * z
+    xy, xz, yz = x * y, x * z, y * z
+    wx, wy, wz = w * x, w * y, w * z
+
+    R = np.empty((len(wxyz), 3, 3), dtype=np.float32)
+    R[:, 0, 0] = 1 - 2 * (yy + zz)
+    R[:, 0, 1] = 2 * (xy - wz)
+    R[:, 0, 2] = 2 * (xz + wy)
+    R[:, 1, 0] = 2 * (xy + wz)
+    R[:, 1, 1] = 1 - 2 * (xx + zz)
+    R[:, 1, 2] = 2 * (yz - wx)
+    R[:, 2, 0] = 2 * (xz - wy)
+    R[:, 2, 1] = 2 * (yz + wx)
+    R[:, 2, 2] = 1 - 2 * (xx + yy)
+    return R
+
+
+def _encode_depth_png(depth: np.ndarray) -> bytes:
+    # Same 24-bit fixed-point packing viser uses for its depth channel; depth
+    # stays lossless (PNG) while the color image goes through JPEG.
+    depth = np.clip(depth * 100_000, 0, 2**24 - 1).astype(np.uint32)
+    intdepth = depth.reshape((*depth.shape[:2], 1)).view(np.uint8)
+    if imagecodecs is not None:
+        # png_encode writes channels as given; swap to the RGBA ordering the
+        # client expects from viser's BGR cv2 path. level=1 since the payload
+        # is re-encoded every frame anyway.
+        return imagecodecs.png_encode(intdepth[:, :, (2, 1, 0, 3)], level=1)
+    return cv2_imencode_with_fallback(
+        "png", intdepth, jpeg_quality=None, channel_ordering="bgr"
+    )
+
 
 @dataclass
 class RenderConfig:
+    # Render sizes are snapped down to multiples of 16 px, the JPEG MCU size
+    # for 4:2:0 subsampling, so the encoder never pads a ragged tail strip.
     jpeg_quality: int = 70
     max_render_res: int = 2048
-    fast_render_scale: float = 0.5
+    # Progressive (scale, idle delay) stages after a camera move: a cheap
+    # quarter-res preview immediately, then half and full resolution once the
+    # camera has been idle long enough. A new move cancels pending stages.
+    resolution_ladder: Tuple[Tuple[float, float], ...] = (
+        (0.25, 0.0),
+        (0.5, 0.1),
+        (1.0, 0.3),
+    )
+    # 4:2:0 halves chroma bandwidth with imperceptible loss at preview
+    # quality; only honoured on the turbojpeg path.
+    chroma_subsampling: Literal["420", "422", "444"] = "420"
 
 class RenderClient():
     def __init__(
@@ -24,57 +138,284 @@ class RenderClient():
         client: viser.ClientHandle,
         render_fn: Callable[[CameraState, Tuple[int, int]], Tuple[np.ndarray, Optional[np.ndarray]]],
         config: RenderConfig,
+        on_moved: Optional[Callable[[], None]] = None,
     ):
 
         self.client = client
-        self.last_render = time.time()
-        self.last_moved = time.time()
+        self.last_render = time.monotonic()
+        self.last_moved = time.monotonic()
 
         self.config = config
         self.render_fn = render_fn
+        self.on_moved = on_moved
+
+        # Pre-bound send paths: each dot in client.scene.set_background_image
+        # (and the queue_message chain) is a lookup paid on every frame.
+        self._set_bg = client.scene.set_background_image
+        self._queue_message = (
+            client.scene._websock_interface.queue_message
+            if _turbo_jpeg is not None else None
+        )
+
+        # Reusable per-resolution output buffers. If render_fn accepts an
+        # `out` kwarg it writes the image in place, avoiding a fresh HxWx3
+        # allocation every frame (~12 MB at 2048^2).
+        self._buf_cache: dict[Tuple[int, int], np.ndarray] = {}
+        self._render_accepts_out = (
+            "out" in inspect.signature(render_fn).parameters
+        )
+
+        # Trailing debounce for camera-move events. Viser fires these at input
+        # device rate, so a drag would otherwise trigger tens of renders whose
+        # outputs are immediately overwritten; only the latest camera state in
+        # each ~33 ms window actually renders.
+        self._pending_render: Optional[threading.Timer] = None
+        self._stage_timers: list[threading.Timer] = []
+        self._move_lock = threading.Lock()
+        self._last_camera_key: Optional[bytes] = None
+
+        # Scratch 4x4 for pose assembly; the bottom row never changes.
+        self._pose_buf = np.empty((4, 4), dtype=np.float32)
+        self._pose_buf[3] = (0, 0, 0, 1)
+
+        # Key of the last frame actually rendered, used to drop renders that
+        # would reproduce it (e.g. a fast render right after the full-res
+        # update loop handled the same camera).
+        self._last_rendered_key: Optional[bytes] = None
+
+        # render() can be entered from both this client's worker thread and
+        # the viewer's full-res pool; serialize so the pose scratch and out
+        # buffers are never written while another render encodes them.
+        self._render_lock = threading.Lock()
+
+        # Depth rarely changes between frames in a static scene; reuse the
+        # previous PNG instead of re-running deflate.
+        self._last_depth_hash: Optional[int] = None
+        self._last_depth_png: Optional[bytes] = None
+
+        # Single-slot "latest wins" mailbox drained by a per-client worker
+        # thread, so render_fn never blocks viser's event loop and a new
+        # request simply replaces any stale pending one.
+        self._mailbox: Optional[float] = None
+        self._stopped = False
+        self._cv = threading.Condition()
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+        client.camera.on_update(self.camera_moved)
+
+
+    def submit(self, image_scale: float):
+        with self._cv:
+            self._mailbox = image_scale
+            self._cv.notify()
+
+
+    def stop(self):
+        with self._cv:
+            self._stopped = True
+            self._cv.notify()
+
+
+    def _run(self):
+        while True:
+            with self._cv:
+                while self._mailbox is None and not self._stopped:
+                    self._cv.wait()
+                if self._stopped:
+                    return
+                image_scale = self._mailbox
+                self._mailbox = None
+            try:
+                self.render(image_scale)
+            except Exception:
+                # A transient render failure (e.g. CUDA OOM at full res) must
+                # not kill the worker and leave the client without renders.
+                traceback.print_exc()
 
 
     def camera_moved(self, _: viser.CameraHandle):
-        self.last_moved = time.time()
-        self.render(self.config.fast_render_scale)
-        
+        self.last_moved = time.monotonic()
+        if self.on_moved is not None:
+            self.on_moved()
+
+        with self._move_lock:
+            self._cancel_stages_locked()
+            if self._pending_render is not None:
+                return
+            self._pending_render = threading.Timer(0.033, self._do_fast_render)
+            self._pending_render.start()
+
+
+    def _cancel_stages_locked(self):
+        for timer in self._stage_timers:
+            timer.cancel()
+        self._stage_timers.clear()
+
+
+    def _do_fast_render(self):
+        with self._move_lock:
+            self._pending_render = None
 
-    def get_camera_state(self) -> CameraState:
         camera = self.client.camera
-        camera_t_world = np.concatenate(
-            [
-                np.concatenate(
-                    [vt.SO3(camera.wxyz).as_matrix(), camera.position[:, None]], 1
-                ),
-                [[0, 0, 0, 1]],
-            ],            
-            0,
-        )
-        
+        # Viser fires the same callback for fov/aspect changes (resize, fov
+        # slider), so the skip key must cover them as well as the pose.
+        key = (camera.wxyz.tobytes() + camera.position.tobytes()
+               + struct.pack("ff", camera.fov, camera.aspect))
+        changed = key != self._last_camera_key
+        self._last_camera_key = key
+
+        # Climb the resolution ladder: the first stage renders now, the
+        # higher-resolution ones only once the camera has settled. The
+        # preview is skipped for a duplicate event, but the higher stages
+        # must still be (re)scheduled -- camera_moved cancelled any pending
+        # ones, and a same-pose event mid-ladder would otherwise strand the
+        # client at the preview resolution.
+        ladder = self.config.resolution_ladder
+        if changed:
+            self.submit(ladder[0][0])
+
+        with self._move_lock:
+            self._cancel_stages_locked()
+            for scale, delay in ladder[1:]:
+                timer = threading.Timer(delay, self._render_stage, args=(scale, delay))
+                self._stage_timers.append(timer)
+                timer.start()
+
+
+    def _render_stage(self, scale: float, delay: float):
+        # A newer move reschedules the ladder; only render once settled.
+        if time.monotonic() - self.last_moved < delay:
+            return
+        self.submit(scale)
+
+
+    def get_camera_state(self, pose: Optional[CameraPose] = None) -> CameraState:
+        camera = self.client.camera
+        if pose is None:
+            wxyz, position, rotation = camera.wxyz, camera.position, None
+        else:
+            wxyz, position, rotation = pose
+
+        T = self._pose_buf
+        if rotation is not None:
+            # Precomputed row from batch_quat_to_mat (multi-client update).
+            T[:3, :3] = rotation
+            T[:3, 3] = position
+        elif _quat_to_pose is not None:
+            w, x, y, z = wxyz
+            px, py, pz = position
+            _quat_to_pose(w, x, y, z, px, py, pz, T)
+        else:
+            # Inline unit-quaternion -> rotation expansion written straight
+            # into the scratch buffer. vt.SO3(wxyz).as_matrix() constructs
+            # objects and intermediate arrays on every camera update; this is
+            # a fixed straight-line expansion with no allocations beyond the
+            # final copy.
+            w, x, y, z = wxyz
+            xx, yy, zz = x * x, y * y, z * z
+            xy, xz, yz = x * y, x * z, y * z
+            wx, wy, wz = w * x, w * y, w * z
+
+            T[0, :3] = (1 - 2 * (yy + zz), 2 * (xy - wz), 2 * (xz + wy))
+            T[1, :3] = (2 * (xy + wz), 1 - 2 * (xx + zz), 2 * (yz - wx))
+            T[2, :3] = (2 * (xz - wy), 2 * (yz + wx), 1 - 2 * (xx + yy))
+            T[:3, 3] = position
+
         return CameraState(
             fov=camera.fov,
             aspect=camera.aspect,
-            camera_t_world=camera_t_world,
+            camera_t_world=T.copy(),
         )
 
 
-    def get_image_size(self, max_size:int, aspect: float) -> Tuple[int, int]:    
+    def get_image_size(self, max_size:int, aspect: float) -> Tuple[int, int]:
         if aspect > 1:
-            return max_size, int(max_size / aspect)
+            w, h = max_size, max_size / aspect
         else:
-            return int(max_size * aspect), max_size
+            w, h = max_size * aspect, max_size
 
+        # Snap down to the 16 px MCU grid (see RenderConfig).
+        return max(int(w) // 16 * 16, 16), max(int(h) // 16 * 16, 16)
+
+
+
+    def render_key(self, image_scale: float, wxyz: np.ndarray, position: np.ndarray) -> bytes:
+        # max_render_res is part of the key so a stationary client still
+        # re-renders after the resolution slider changes it.
+        return (wxyz.tobytes() + position.tobytes()
+                + struct.pack("ffi", self.client.camera.fov, image_scale,
+                              self.config.max_render_res))
+
+
+    def render(
+        self,
+        image_scale: float,
+        pose: Optional[CameraPose] = None,
+        scene_changed: bool = False,
+    ):
+        with self._render_lock:
+            if pose is None:
+                # Snapshot once so the skip key and the rendered pose always
+                # describe the same camera state, even if it moves mid-render.
+                camera_handle = self.client.camera
+                pose = (camera_handle.wxyz, camera_handle.position, None)
+
+            # If neither the scene nor the camera changed, the frame already
+            # sent to this client is still valid.
+            key = self.render_key(image_scale, pose[0], pose[1])
+            if key == self._last_rendered_key and not scene_changed:
+                return
+
+            self.last_render = time.monotonic()
+
+            camera = self.get_camera_state(pose)
+            image_size = self.get_image_size(image_scale * self.config.max_render_res, camera.aspect)
+            if self._render_accepts_out:
+                buf = self._buf_cache.get(image_size)
+                if buf is None:
+                    buf = self._buf_cache.setdefault(
+                        image_size,
+                        np.empty((image_size[1], image_size[0], 3), dtype=np.uint8),
+                    )
+                img, depth = self.render_fn(camera, image_size, out=buf)
+            else:
+                img, depth = self.render_fn(camera, image_size)
+
+            self.set_background(img, depth)
+            self._last_rendered_key = key
+
+
+    def set_background(self, img: np.ndarray, depth: Optional[np.ndarray]):
+        if _turbo_jpeg is None:
+            self._set_bg(
+                image=img, format="jpeg",
+                jpeg_quality=self.config.jpeg_quality,
+                depth=depth)
+            return
+
+        jpeg_bytes = _turbo_jpeg.encode(
+            np.ascontiguousarray(img),
+            quality=self.config.jpeg_quality,
+            pixel_format=TJPF_RGB,
+            jpeg_subsample=_subsampling[self.config.chroma_subsampling],
+        )
+        self._queue_message(
+            _messages.BackgroundImageMessage(
+                format="jpeg",
+                rgb_data=jpeg_bytes,
+                depth_data=self._depth_data(depth),
+            )
+        )
 
 
-    def render(self, image_scale: float):
-        self.last_render = time.time()
+    def _depth_data(self, depth: Optional[np.ndarray]) -> Optional[bytes]:
+        if depth is None:
+            return None
 
-        camera = self.get_camera_state()
-        image_size = self.get_image_size(image_scale * self.config.max_render_res, camera.aspect)
-        img, depth = self.render_fn(camera, image_size)
-  
-        self.client.scene.set_background_image(
-            image=img, format="jpeg", 
-            jpeg_quality=self.config.jpeg_quality, 
-            depth=depth)
+        depth_hash = hash(depth.tobytes())
+        if depth_hash != self._last_depth_hash:
+            self._last_depth_hash = depth_hash
+            self._last_depth_png = _encode_depth_png(depth)
+        return self._last_depth_png
 
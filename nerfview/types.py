@@ -1,20 +1,33 @@
 from dataclasses import dataclass
-from typing import Literal, Tuple
+from functools import lru_cache
+import math
+from typing import Tuple
+
 import numpy as np
 
 
-@dataclass
+@lru_cache(maxsize=8)
+def _projection(fov: float, w: int, h: int) -> np.ndarray:
+    # fov and image size change rarely compared to pose, so steady-state
+    # camera drags hit the cache. math.tan is much cheaper than np.tan on a
+    # scalar. The cached array is shared between callers, so mark it
+    # read-only.
+    f = h / 2.0 / math.tan(fov / 2.0)
+    params = np.array([f, f, w / 2.0, h / 2.0], dtype=np.float32)
+    params.flags.writeable = False
+    return params
+
+
+@dataclass(frozen=True)
 class CameraState(object):
+    # Frozen and slotted: instances are created per camera event and read in
+    # tight render loops, so skip the per-instance __dict__.
+    __slots__ = ("fov", "aspect", "camera_t_world")
+
     fov: float
     aspect: float
-    camera_t_world: np.ndarray #  4x4
+    camera_t_world: np.ndarray  # 4x4
 
-    @property
     def projection(self, image_size: Tuple[int, int]) -> np.ndarray:
-      w, h = image_size
-      f = h / 2.0 / np.tan(self.fov / 2.0)
-
-      return np.array([f, f, w/2., h/2.])
-
-
-
+        w, h = image_size
+        return _projection(self.fov, w, h)
@@ -1,13 +1,15 @@
+from concurrent.futures import ThreadPoolExecutor
 from functools import partial
+import os
 import time
 from threading import Lock
-from typing import Any, Callable, Optional, Tuple
+from typing import Any, Callable, Literal, Optional, Tuple
 
 import numpy as np
 import viser
 from nerfview.types import CameraState
 
-from .render_client import RenderClient, RenderConfig
+from .render_client import RenderClient, RenderConfig, batch_quat_to_mat
 
 
 class Viewer(object):
@@ -21,6 +23,10 @@ class Viewer(object):
     server (viser.ViserServer): The viser server object to bind to.
     render_fn (Callable): A function that takes a camera state and image
       resolution as input and returns an image and (optionally) a depth map.
+      It may be called concurrently from several threads when multiple
+      clients are connected, so it must be thread-safe.
+    mode (str): "training" shows the pause/resume controls in addition to
+      the rendering GUI; "rendering" (default) hides them.
   """
 
   def __init__(
@@ -30,17 +36,32 @@ class Viewer(object):
       [CameraState, Tuple[int, int]],
       Tuple[np.ndarray, Optional[np.ndarray]], # image h,w,3, depth h,w
     ],
-    config: RenderConfig = RenderConfig()
+    config: RenderConfig = RenderConfig(),
+    mode: Literal["rendering", "training"] = "rendering",
   ):
     # Public states.
     self.server = server
     self.render_fn = render_fn
+    self.mode = mode
 
-    self.paused = False        
+    self.paused = False
     self.renderers: dict[int, RenderClient] = {}
 
+    self.metrics: dict[str, Any] = {}
+    self._last_metrics_str: str = ""
+
     self.config = config
-    self.last_update = time.time()
+    self.last_update = time.monotonic()
+    self._last_moved_any = 0.0
+
+    # Clients whose camera moved since the last full-res update; update()
+    # drains this instead of scanning every renderer's timestamps.
+    self._dirty: set[int] = set()
+
+    # Full-res renders for all clients are dispatched together; render_fn
+    # (torch/cuda) and the JPEG encoder both release the GIL, so clients
+    # overlap rather than paying N x single-render latency.
+    self._pool = ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1))
 
     server.on_client_disconnect(self.disconnect_client)
     server.on_client_connect(self.connect_client)
@@ -91,27 +112,72 @@ class Viewer(object):
 
   def disconnect_client(self, client: viser.ClientHandle):
     client_id = client.client_id
-    self.renderers.pop(client_id)
+    self._dirty.discard(client_id)
+    self.renderers.pop(client_id).stop()
 
   def connect_client(self, client: viser.ClientHandle):
     client_id = client.client_id
-    self.renderers[client_id] = RenderClient(client=client, render_fn=self.render_fn, config=self.config)
+    self.renderers[client_id] = RenderClient(
+      client=client, render_fn=self.render_fn, config=self.config,
+      on_moved=partial(self._note_moved, client_id),
+    )
+
+  def _note_moved(self, client_id: int):
+    self._last_moved_any = time.monotonic()
+    self._dirty.add(client_id)
 
 
   def update_metrics(self, metrics: dict[str, Any]):
+    self.metrics = metrics
+
+    # Pushing unchanged markdown still costs a websocket diff broadcast per
+    # tick; only touch the GUI when the rendered string differs.
+    text = self.metrics_text(metrics)
+    if text == self._last_metrics_str:
+      return
+    self._last_metrics_str = text
+
     with self.server.atomic(), self.stats_folder:
-      self.stats_text.content = self.metrics_text(metrics)
+      self.stats_text.content = text
 
 
   @property
   def last_moved(self) -> float:
-    times = [r.last_moved for r in self.renderers.values()]
-    return max(times, default=0.0)
+    return self._last_moved_any
 
 
   def update(self, scene_changed: bool = False):
-    for renderer in self.renderers.values():
-      if scene_changed or renderer.last_render > self.last_update:
-        renderer.render(1.0)
-
-    self.last_update = time.time()
+    if scene_changed:
+      self._dirty.clear()
+      renderers = list(self.renderers.values())
+    else:
+      renderers = []
+      while self._dirty:
+        renderer = self.renderers.get(self._dirty.pop())
+        if renderer is not None:
+          renderers.append(renderer)
+
+    if renderers:
+      # Snapshot every camera once, then one vectorized quaternion->matrix
+      # pass for all clients; each render receives the matching snapshot so
+      # rotation, translation and skip key stay consistent even if a camera
+      # moves while the batch is in flight.
+      cameras = [
+        (renderer.client.camera.wxyz, renderer.client.camera.position)
+        for renderer in renderers
+      ]
+      rotations = batch_quat_to_mat(np.stack([wxyz for wxyz, _ in cameras]))
+      futures = [
+        self._pool.submit(
+          renderer.render, 1.0,
+          pose=(cameras[i][0], cameras[i][1], rotations[i]),
+          scene_changed=scene_changed,
+        )
+        for i, renderer in enumerate(renderers)
+      ]
+      # result() re-raises render failures in the caller, as the serial
+      # loop used to.
+      for future in futures:
+        future.result()
+
+    self.last_update = time.monotonic()